@@ -14,6 +14,7 @@ Project: Conversational IVR Modernization
 
 from fastapi import FastAPI, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, ORJSONResponse
 from pydantic import BaseModel
 from typing import Optional, Dict, Any
 import uuid
@@ -29,10 +30,22 @@ UTILS_DIR = os.path.join(BASE_DIR, "utils")
 if UTILS_DIR not in sys.path:
     sys.path.append(UTILS_DIR)
 
-from flow_manager import FlowManager
+try:
+    # Imported as backend.main: share the one backend.utils.flow_manager
+    # module (and its manager cache) with everything else in the package
+    from .utils.flow_manager import get_flow_manager
+except ImportError:
+    from flow_manager import get_flow_manager
 
+try:
+    import orjson  # noqa: F401
+    # orjson renders response bodies several times faster than json.dumps
+    DefaultResponse = ORJSONResponse
+except ImportError:
+    DefaultResponse = JSONResponse
 
-app = FastAPI(title="Train IVR System", version="1.0.0")
+
+app = FastAPI(title="Train IVR System", version="1.0.0", default_response_class=DefaultResponse)
 
 app.add_middleware(
     CORSMiddleware,
@@ -49,8 +62,8 @@ app.add_middleware(
 
 # In-memory session storage
 sessions: Dict[str, Dict[str, Any]] = {}
-# Initialize flow manager - will auto-load all flows
-flow_manager = FlowManager()
+# Shared flow manager - loads all flows on first use
+flow_manager = get_flow_manager()
 
 # Force reload flows on startup to ensure latest changes
 def reload_flows():
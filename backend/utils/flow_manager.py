@@ -12,10 +12,32 @@ Key Features:
 - Flow transition management
 """
 
+import dataclasses
+import hashlib
+import itertools
 import json
 import os
+import pickle
+import random
+import stat
 import sys
-from typing import Dict, Any, Tuple, Optional
+import tempfile
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, Any, FrozenSet, Mapping, Tuple, Optional
+
+try:
+    import ahocorasick
+except ImportError:
+    # Fall back to per-phrase substring checks when pyahocorasick is missing
+    ahocorasick = None
+
+try:
+    # orjson parses bytes directly and much faster than the stdlib parser;
+    # its JSONDecodeError subclasses json.JSONDecodeError
+    from orjson import loads as json_loads
+except ImportError:
+    json_loads = json.loads
 
 # Import advanced NLP
 try:
@@ -27,75 +49,328 @@ except ImportError:
     from advanced_nlp import advanced_nlp
 
 
+_DEFAULT_INVALID_MESSAGE = (
+    "I didn't quite understand that. Could you please try again? You can also say "
+    "'go back' or 'main menu' to return to the main menu, or press star on the keypad."
+)
+
+# Flows shipped with the backend, in backend/flows next to this package
+_DEFAULT_FLOWS_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "flows"
+)
+
+# Collected fields that can be picked out of free speech
+_FIELD_EXTRACTORS = {
+    "train_class": advanced_nlp.extract_class_from_speech,
+    "train_number": advanced_nlp.extract_train_number,
+    "pnr": advanced_nlp.extract_pnr,
+}
+
+
+# Shared empty mapping for flow-jump and invalid-navigation replies and for
+# StateView defaults; read-only so no caller can alter it for later replies
+_EMPTY: Mapping[str, str] = MappingProxyType({})
+
+# dataclass(slots=True) needs Python 3.10; older interpreters get a plain dataclass
+_SLOTS = {"slots": True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclasses.dataclass(**_SLOTS)
+class StateView:
+    """Flow state digested once at load time, so each turn reads attributes
+    instead of probing the raw state dict"""
+    message: str = ""
+    options: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    is_end: bool = False
+    transitions: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    keypad_map: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    keywords: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    speech_patterns: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    # Speech pattern phrases in declaration order, for fuzzy matching
+    pattern_phrases: Tuple[str, ...] = ()
+    actions: Mapping[str, Any] = dataclasses.field(default_factory=lambda: _EMPTY)
+    invalid_input_message: str = _DEFAULT_INVALID_MESSAGE
+    # Field name when the state has a collect_data action, otherwise None
+    collect_field: Optional[str] = None
+    collect_next: str = ""
+    # Function name when the state has a dynamic_response action, otherwise None
+    dynamic_function: Optional[str] = None
+    dynamic_next: str = "main_menu"
+    # Aho-Corasick automaton over keywords then speech patterns, or None
+    phrase_matcher: Any = None
+    # Speech input equal to one of these keys goes straight to its target;
+    # left empty for data-collecting states, which must see every answer
+    exact_targets: Mapping[str, str] = dataclasses.field(default_factory=lambda: _EMPTY)
+    # Targets of this state that jump to another flow ("flow:<name>"),
+    # so routing tests set membership instead of scanning the prefix
+    flow_jumps: FrozenSet[str] = frozenset()
+    # Views of the extractable collect_data states that directly follow
+    # this one, so one utterance can answer several
+    collect_chain: Tuple["StateView", ...] = dataclasses.field(default=(), repr=False, compare=False)
+    
+    @classmethod
+    def from_state(cls, state_data: Mapping[str, Any]) -> "StateView":
+        """Build a view from a raw state dict"""
+        actions = state_data.get("actions", _EMPTY)
+        collect = actions.get("collect_data")
+        dynamic = actions.get("dynamic_response")
+        targets = [
+            *state_data.get("transitions", _EMPTY).values(),
+            *state_data.get("keypad_map", _EMPTY).values(),
+            *state_data.get("keywords", _EMPTY).values(),
+            *state_data.get("speech_patterns", _EMPTY).values(),
+        ]
+        if collect is not None:
+            targets.append(collect.get("next_state", ""))
+        return cls(
+            message=state_data.get("message", ""),
+            options=state_data.get("options", _EMPTY),
+            is_end=state_data.get("is_end", False),
+            transitions=state_data.get("transitions", _EMPTY),
+            keypad_map=state_data.get("keypad_map", _EMPTY),
+            keywords=state_data.get("keywords", _EMPTY),
+            speech_patterns=state_data.get("speech_patterns", _EMPTY),
+            pattern_phrases=tuple(state_data.get("speech_patterns", _EMPTY)),
+            actions=actions,
+            invalid_input_message=state_data.get("invalid_input_message", _DEFAULT_INVALID_MESSAGE),
+            collect_field=collect.get("field", "") if collect is not None else None,
+            collect_next=collect.get("next_state", "") if collect is not None else "",
+            dynamic_function=dynamic.get("function", "") if dynamic is not None else None,
+            dynamic_next=dynamic.get("next_state", "main_menu") if dynamic is not None else "main_menu",
+            phrase_matcher=_build_phrase_matcher(
+                state_data.get("keywords", _EMPTY), state_data.get("speech_patterns", _EMPTY)
+            ),
+            flow_jumps=frozenset(target for target in targets if target.startswith("flow:")),
+            exact_targets=_EMPTY if collect is not None else {
+                **state_data.get("keywords", _EMPTY),
+                **state_data.get("transitions", _EMPTY),
+                **state_data.get("keypad_map", _EMPTY),
+            },
+        )
+    
+    def match_phrase(self, user_input: str) -> Optional[str]:
+        """Return the target of the first declared keyword or speech pattern found in the input"""
+        if self.phrase_matcher is not None:
+            # One pass finds every phrase; the earliest declared one wins
+            hits = [hit for _, hit in self.phrase_matcher.iter(user_input)]
+            return min(hits)[1] if hits else None
+        for keyword, target in self.keywords.items():
+            if keyword in user_input:
+                return target
+        for pattern, target in self.speech_patterns.items():
+            if pattern in user_input:
+                return target
+        return None
+
+
+def _build_phrase_matcher(keywords: Mapping[str, str], speech_patterns: Mapping[str, str]):
+    """Compile keywords and speech patterns into one automaton of (order, target)"""
+    # A per-state Hyperscan database was measured against this: with ~30
+    # phrases and utterance-length input the match callbacks dominate and it
+    # came out 1.6-1.7x slower, so Aho-Corasick stays
+    if ahocorasick is None or not (keywords or speech_patterns):
+        return None
+    automaton = ahocorasick.Automaton()
+    phrases = list(keywords.items()) + list(speech_patterns.items())
+    for order, (phrase, target) in reversed(list(enumerate(phrases))):
+        # Walking backwards leaves the earliest entry for a repeated phrase
+        automaton.add_word(phrase, (order, target))
+    automaton.make_automaton()
+    return automaton
+
+
+def _freeze(value: Any) -> Any:
+    """Recursively turn parsed JSON into read-only mappings and tuples"""
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+# Stand-in for flows missing from the cache
+_EMPTY_FLOW: Mapping[str, Any] = MappingProxyType({})
+
+# Stand-in for states missing from a flow
+_EMPTY_STATE = StateView()
+
+
 class FlowManager:
     """Manages IVR flow navigation and state transitions"""
     
+    FLOW_FILES = (
+        "train_main.json",
+        "booking.json",
+        "status.json",
+        "schedule.json",
+        "cancellation.json",
+        "agent.json",
+        "pnr_status.json",
+        "seat_availability.json",
+        "fare_enquiry.json",
+        "train_between_stations.json"
+    )
+    
+    # Parsed flows are pickled here, tagged with a fingerprint of the JSON files.
+    # The file sits next to the flows unless IVR_FLOW_CACHE_DIR names another
+    # directory (the tests use this to keep the source tree clean); it is only
+    # loaded when owned by this user and writable by no one else
+    SIDECAR_FILE = "flows_cache.pkl"
+    
     def __init__(self, flows_dir: str = None):
-        if flows_dir is None:
-            # Determine flows directory relative to this file
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            self.flows_dir = os.path.join(os.path.dirname(current_dir), "flows")
-        else:
-            self.flows_dir = flows_dir
-        self.flows_cache: Dict[str, Dict[str, Any]] = {}
+        self.flows_dir = _DEFAULT_FLOWS_DIR if flows_dir is None else flows_dir
+        self._sidecar_path = os.path.join(
+            os.environ.get("IVR_FLOW_CACHE_DIR") or self.flows_dir, self.SIDECAR_FILE
+        )
+        # Flows are frozen after loading, so one manager can be shared safely
+        self.flows_cache: Dict[str, Mapping[str, Any]] = {}
+        self._fingerprint: Optional[str] = None
+        # id(flow) -> (flow, state views), rebuilt whenever flows are loaded
+        self._state_views: Dict[int, Tuple[Mapping[str, Any], Dict[str, StateView]]] = {}
         self._load_all_flows()
     
     def _load_all_flows(self):
         """Load all JSON flow files into cache"""
-        flow_files = [
-            "train_main.json",
-            "booking.json",
-            "status.json",
-            "schedule.json",
-            "cancellation.json",
-            "agent.json",
-            "pnr_status.json",
-            "seat_availability.json",
-            "fare_enquiry.json",
-            "train_between_stations.json"
-        ]
+        fingerprint = self._flows_fingerprint()
+        if fingerprint == self._fingerprint:
+            return  # Nothing changed on disk since the last load
         
-        for flow_file in flow_files:
-            flow_name = flow_file.replace(".json", "")
+        flows = self._read_sidecar(fingerprint)
+        if flows is None:
+            flows = {}
+            # Sequential on purpose: the ten files total ~13 KB, and a thread
+            # pool measured 4-5x slower than this loop (orjson also holds
+            # the GIL while parsing)
+            for flow_file in self.FLOW_FILES:
+                flow_name = flow_file.replace(".json", "")
+                try:
+                    flow_path = os.path.join(self.flows_dir, flow_file)
+                    with open(flow_path, "rb") as f:
+                        flows[flow_name] = json_loads(f.read())
+                except FileNotFoundError:
+                    print(f"Warning: Flow file {flow_file} not found")
+                except json.JSONDecodeError as e:
+                    print(f"Error loading {flow_file}: {e}")
+            # Only cache a complete set, so problems are reported on every start
+            if len(flows) == len(self.FLOW_FILES):
+                self._write_sidecar(fingerprint, flows)
+        
+        # The sidecar keeps plain dicts, since mapping proxies can't be pickled
+        self.flows_cache.update((name, _freeze(flow)) for name, flow in flows.items())
+        self._fingerprint = fingerprint
+        self._state_views = {
+            id(flow): (flow, self._build_state_views(flow))
+            for flow in self.flows_cache.values()
+        }
+    
+    @staticmethod
+    def _build_state_views(flow: Mapping[str, Any]) -> Dict[str, StateView]:
+        """Digest every state of a flow into a StateView"""
+        views = {
+            name: StateView.from_state(state_data)
+            for name, state_data in flow.get("states", {}).items()
+        }
+        for name, view in views.items():
+            if view.collect_field is None:
+                continue
+            chain = []
+            seen = {name}
+            target = view.collect_next
+            while target in views and target not in seen:
+                link = views[target]
+                if link.collect_field not in _FIELD_EXTRACTORS:
+                    break
+                chain.append(link)
+                seen.add(target)
+                target = link.collect_next
+            view.collect_chain = tuple(chain)
+        return views
+    
+    def _get_state_views(self, flow: Mapping[str, Any]) -> Dict[str, StateView]:
+        """Return the prebuilt state views for a flow, building them for unknown flows"""
+        cached = self._state_views.get(id(flow))
+        if cached is not None and cached[0] is flow:
+            return cached[1]
+        return self._build_state_views(flow)
+    
+    def _flows_fingerprint(self) -> str:
+        """Hash the directory and the name, mtime and size of every flow file"""
+        digest = hashlib.sha256()
+        # A shared cache directory may serve more than one flows directory
+        digest.update(f"{os.path.abspath(self.flows_dir)};".encode())
+        for flow_file in self.FLOW_FILES:
+            try:
+                stat = os.stat(os.path.join(self.flows_dir, flow_file))
+                digest.update(f"{flow_file}:{stat.st_mtime_ns}:{stat.st_size};".encode())
+            except OSError:
+                digest.update(f"{flow_file}:missing;".encode())
+        return digest.hexdigest()
+    
+    def _read_sidecar(self, fingerprint: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """Return the pickled flows if they were built from the current files"""
+        try:
+            with open(self._sidecar_path, "rb") as f:
+                # Unpickling runs code, so a cache dir like /tmp must not let
+                # another user plant the file: only load what we wrote
+                if not _owned_privately(os.fstat(f.fileno())):
+                    return None
+                cached = pickle.loads(f.read())
+        except (OSError, pickle.PickleError, EOFError, ValueError):
+            return None
+        if not isinstance(cached, dict) or cached.get("fingerprint") != fingerprint:
+            return None
+        return cached.get("flows")
+    
+    def _write_sidecar(self, fingerprint: str, flows: Dict[str, Dict[str, Any]]):
+        """Pickle parsed flows to the sidecar file, if its directory is writable"""
+        data = pickle.dumps({"fingerprint": fingerprint, "flows": flows}, protocol=5)
+        directory, name = os.path.split(self._sidecar_path)
+        try:
+            # Write a temp file and swap it in, so workers starting together
+            # never read a half-written pickle
+            fd, tmp_path = tempfile.mkstemp(prefix=name + ".", suffix=".tmp", dir=directory)
+        except OSError:
+            return  # Read-only deployments just parse the JSON each start
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            # mkstemp creates 0600; give the sidecar the usual file mode
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self._sidecar_path)
+        except OSError:
             try:
-                flow_path = os.path.join(self.flows_dir, flow_file)
-                with open(flow_path, "r", encoding="utf-8") as f:
-                    self.flows_cache[flow_name] = json.load(f)
-            except FileNotFoundError:
-                print(f"Warning: Flow file {flow_file} not found")
-            except json.JSONDecodeError as e:
-                print(f"Error loading {flow_file}: {e}")
+                os.remove(tmp_path)
+            except OSError:
+                pass
     
-    def get_flow(self, flow_name: str) -> Dict[str, Any]:
-        """Get a flow by name"""
-        return self.flows_cache.get(flow_name, {})
+    def get_flow(self, flow_name: str) -> Mapping[str, Any]:
+        """Get a read-only flow by name"""
+        return self.flows_cache.get(flow_name, _EMPTY_FLOW)
     
     def process_input(
         self,
-        flow: Dict[str, Any],
+        flow: Mapping[str, Any],
         current_state: str,
         user_input: str,
         is_keypad: bool,
         session: Dict[str, Any]
-    ) -> Tuple[str, str, Optional[Dict[str, str]], bool]:
+    ) -> Tuple[str, str, Optional[Mapping[str, str]], bool]:
         """
         Process user input and return next state, message, options, and is_end flag
         
         Returns:
             (next_state, message, options, is_end)
         """
-        states = flow.get("states", {})
-        state_data = states.get(current_state, {})
+        # Normalize once; every lookup below compares against lowercase keys
+        user_input = user_input.strip().lower()
+        states = self._get_state_views(flow)
+        state = states.get(current_state, _EMPTY_STATE)
         
         # Handle keypad input
         if is_keypad:
-            transitions = state_data.get("transitions", {})
-            keypad_map = state_data.get("keypad_map", {})
-            
             # First, check if we need to collect data before transition
-            if "actions" in state_data and "collect_data" in state_data["actions"]:
-                action = state_data["actions"]["collect_data"]
-                field = action.get("field", "")
+            if state.collect_field is not None:
+                field = state.collect_field
                 
                 # Map keypad input to actual value (for class selection)
                 if field == "train_class":
@@ -104,39 +379,28 @@ class FlowManager:
                         session["data"][field] = class_map[user_input]
                 
                 # Get next state
-                target = action.get("next_state", "")
-                if target.startswith("flow:"):
-                    return (target, "", {}, False)
-                elif target in states:
-                    next_state_data = states[target]
-                    return (
-                        target,
-                        next_state_data.get("message", ""),
-                        next_state_data.get("options", {}),
-                        next_state_data.get("is_end", False)
-                    )
+                reply = self._resolve(state.collect_next, state, states)
+                if reply is not None:
+                    return reply
             
             # Check direct keypad mapping
-            if user_input in keypad_map:
-                target = keypad_map[user_input]
-                if target.startswith("flow:"):
-                    return (target, "", {}, False)
-                elif target in states:
-                    next_state_data = states[target]
-                    return (
-                        target,
-                        next_state_data.get("message", ""),
-                        next_state_data.get("options", {}),
-                        next_state_data.get("is_end", False)
-                    )
+            if user_input in state.keypad_map:
+                reply = self._resolve(state.keypad_map[user_input], state, states)
+                if reply is not None:
+                    return reply
             
             # Check transitions
-            if user_input in transitions:
-                target = transitions[user_input]
-                return self._follow_transition(target, states, session)
+            if user_input in state.transitions:
+                target = state.transitions[user_input]
+                return self._follow_transition(target, state, states, session)
         
         # Handle speech/NLP input with intelligent processing
         else:
+            # An exact key or keyword needs no NLP at all
+            target = state.exact_targets.get(user_input)
+            if target is not None:
+                return self._follow_transition(target, state, states, session)
+            
             # Use NLP engine for intent understanding
             nlp_result = advanced_nlp.extract_intent(user_input, current_state)
             
@@ -144,56 +408,20 @@ class FlowManager:
             if nlp_result and nlp_result.get("type") == "greeting":
                 greeting_response = nlp_result.get("response", "Hello! How can I help you?")
                 # Return greeting response but stay in current state
-                return (current_state, greeting_response, state_data.get("options", {}), False)
+                return (current_state, greeting_response, state.options, False)
             
-            # First, check if we need to collect data before transition
-            if "actions" in state_data and "collect_data" in state_data["actions"]:
-                action = state_data["actions"]["collect_data"]
-                field = action.get("field", "")
-                
-                # Use advanced NLP to extract class
-                if field == "train_class":
-                    extracted_class = advanced_nlp.extract_class_from_speech(user_input)
-                    if extracted_class:
-                        session["data"][field] = extracted_class
-                        target = action.get("next_state", "")
-                        if target in states:
-                            next_state_data = states[target]
-                            return (
-                                target,
-                                next_state_data.get("message", ""),
-                                next_state_data.get("options", {}),
-                                next_state_data.get("is_end", False)
-                            )
-                
-                # Extract train number, PNR, etc. from any input
-                if field == "train_number":
-                    train_num = advanced_nlp.extract_train_number(user_input)
-                    if train_num:
-                        session["data"][field] = train_num
-                        target = action.get("next_state", "")
-                        if target in states:
-                            next_state_data = states[target]
-                            return (
-                                target,
-                                next_state_data.get("message", ""),
-                                next_state_data.get("options", {}),
-                                next_state_data.get("is_end", False)
-                            )
-                
-                if field == "pnr":
-                    pnr = advanced_nlp.extract_pnr(user_input)
-                    if pnr:
-                        session["data"][field] = pnr
-                        target = action.get("next_state", "")
-                        if target in states:
-                            next_state_data = states[target]
-                            return (
-                                target,
-                                next_state_data.get("message", ""),
-                                next_state_data.get("options", {}),
-                                next_state_data.get("is_end", False)
-                            )
+            # First, check if we need to collect data before transition.
+            # Class, train number and PNR are extracted with advanced NLP
+            extract = _FIELD_EXTRACTORS.get(state.collect_field)
+            if extract is not None:
+                value = extract(user_input)
+                if value:
+                    session["data"][state.collect_field] = value
+                    # The last filled link declared the target, flow jump or not
+                    last = self._collect_chain(state, user_input, session)
+                    reply = self._resolve(last.collect_next, last, states)
+                    if reply is not None:
+                        return reply
             
             # Use Advanced NLP intent recognition
             if nlp_result and nlp_result.get("target"):
@@ -201,83 +429,54 @@ class FlowManager:
                 confidence = nlp_result.get("confidence", 0.0)
                 
                 if confidence > 0.7:  # High confidence match
-                    return self._follow_transition(target, states, session)
-            
-            # Fallback to simple keyword matching for backwards compatibility
-            keywords = state_data.get("keywords", {})
-            for keyword, target in keywords.items():
-                if keyword in user_input:
-                    return self._follow_transition(target, states, session)
+                    return self._follow_transition(target, state, states, session)
             
-            # Check for common phrases
-            speech_patterns = state_data.get("speech_patterns", {})
-            for pattern, target in speech_patterns.items():
-                if pattern in user_input:
-                    return self._follow_transition(target, states, session)
+            # Fallback to simple keyword matching for backwards compatibility,
+            # then check for common phrases
+            target = state.match_phrase(user_input)
+            if target is not None:
+                return self._follow_transition(target, state, states, session)
             
             # If nothing matched, check for partial matches or similar phrases
             # This helps avoid getting stuck on slightly wrong input
-            for pattern, target in speech_patterns.items():
-                similarity = advanced_nlp.similarity(user_input, pattern)
-                if similarity > 0.6:  # Partial match threshold
-                    return self._follow_transition(target, states, session)
+            index = advanced_nlp.first_similar(user_input, state.pattern_phrases, 0.6)  # Partial match threshold
+            if index is not None:
+                target = state.speech_patterns[state.pattern_phrases[index]]
+                return self._follow_transition(target, state, states, session)
         
         # Handle special actions (data collection, dynamic responses)
-        actions = state_data.get("actions", {})
-        if "collect_data" in actions:
-            field = actions["collect_data"].get("field", "")
-            session["data"][field] = user_input
+        if state.collect_field is not None:
+            session["data"][state.collect_field] = user_input
             
             # Move to next state after data collection
-            next_state = actions["collect_data"].get("next_state", "")
-            if next_state.startswith("flow:"):
-                return (next_state, "", {}, False)
-            elif next_state in states:
-                next_state_data = states[next_state]
-                next_message = next_state_data.get("message", "")
-                
-                # If next state also collects data, automatically show that question
-                # Don't wait for another input - show the question immediately
-                if "actions" in next_state_data and "collect_data" in next_state_data["actions"]:
-                    # Return with the next question message
-                    return (
-                        next_state,
-                        next_message,  # This will be spoken/displayed immediately
-                        next_state_data.get("options", {}),
-                        next_state_data.get("is_end", False)
-                    )
-                else:
-                    # Next state doesn't collect data, just show message
-                    return (
-                        next_state,
-                        next_message,
-                        next_state_data.get("options", {}),
-                        next_state_data.get("is_end", False)
-                    )
+            # If the next state also collects data, its message is the next
+            # question and is shown immediately without waiting for input
+            reply = self._resolve(state.collect_next, state, states)
+            if reply is not None:
+                return reply
         
         # Handle dynamic responses (train status, booking confirmation, etc.)
-        if "dynamic_response" in actions:
-            response_func = actions["dynamic_response"].get("function", "")
-            message = self._generate_dynamic_response(response_func, session, user_input)
-            next_state = actions["dynamic_response"].get("next_state", "main_menu")
+        if state.dynamic_function is not None:
+            message = self._generate_dynamic_response(state.dynamic_function, session, user_input)
+            next_state = state.dynamic_next
             
             # Check if returning to main menu
             if next_state == "main_menu" and flow.get("name") != "train_main":
-                return ("flow:train_main", "", {}, False)
+                return ("flow:train_main", "", _EMPTY, False)
             elif next_state in states:
                 return (
                     next_state,
                     message,
-                    states[next_state].get("options", {}),
-                    states[next_state].get("is_end", False)
+                    states[next_state].options,
+                    states[next_state].is_end
                 )
             else:
                 # Return to main menu in main flow
-                main_menu = states.get("main_menu", {})
+                main_menu = states.get("main_menu", _EMPTY_STATE)
                 return (
                     "main_menu",
                     message,
-                    main_menu.get("options", {}),
+                    main_menu.options,
                     False
                 )
         
@@ -287,42 +486,70 @@ class FlowManager:
             invalid_msg = "I'm sorry, I didn't quite catch that. No worries! Let me help you: You can say things like 'book a ticket', 'check train status', 'schedule', 'cancel ticket', 'PNR status', 'seat availability', 'fare enquiry', 'trains between stations', or 'speak to agent'. Or you can press any number from 0 to 9 on the keypad. What would you like to do?"
         else:
             # Context-aware invalid message based on current state
-            invalid_msg = state_data.get("invalid_input_message", 
-                "I didn't quite understand that. Could you please try again? You can also say 'go back' or 'main menu' to return to the main menu, or press star on the keypad.")
+            invalid_msg = state.invalid_input_message
             
             # Add helpful hints based on what we're trying to collect
-            if "actions" in state_data and "collect_data" in state_data["actions"]:
-                field = state_data["actions"]["collect_data"].get("field", "")
-                if field == "train_number":
-                    invalid_msg += " Please provide a 5-digit train number."
-                elif field == "pnr":
-                    invalid_msg += " Please provide your 10-digit PNR number."
-                elif field == "train_class":
-                    invalid_msg += " You can say 'Sleeper', 'AC', or 'Tatkal', or press 1, 2, or 3."
+            field = state.collect_field
+            if field == "train_number":
+                invalid_msg += " Please provide a 5-digit train number."
+            elif field == "pnr":
+                invalid_msg += " Please provide your 10-digit PNR number."
+            elif field == "train_class":
+                invalid_msg += " You can say 'Sleeper', 'AC', or 'Tatkal', or press 1, 2, or 3."
         
-        return (current_state, invalid_msg, state_data.get("options", {}), False)
+        return (current_state, invalid_msg, state.options, False)
+    
+    @staticmethod
+    def _view_tuple(view: StateView, target: str) -> Tuple[str, str, Mapping[str, str], bool]:
+        """Build the (next_state, message, options, is_end) reply for entering a state"""
+        return (target, view.message, view.options, view.is_end)
+    
+    def _resolve(
+        self,
+        target: str,
+        state: StateView,
+        states: Dict[str, StateView]
+    ) -> Optional[Tuple[str, str, Mapping[str, str], bool]]:
+        """Return the reply for moving from state to a declared flow jump or
+        a state of this flow, or None if the target is neither"""
+        if target in state.flow_jumps:
+            # Transition to another flow
+            return (target, "", _EMPTY, False)
+        next_state_view = states.get(target)
+        if next_state_view is not None:
+            return self._view_tuple(next_state_view, target)
+        return None
+    
+    @staticmethod
+    def _collect_chain(state: StateView, user_input: str, session: Dict[str, Any]) -> StateView:
+        """Fill the following collect states answered by the same utterance
+        and return the last state whose field was filled"""
+        last = state
+        for link in state.collect_chain:
+            value = _FIELD_EXTRACTORS[link.collect_field](user_input)
+            if not value:
+                break
+            session["data"][link.collect_field] = value
+            last = link
+        return last
     
     def _follow_transition(
         self,
         target: str,
-        states: Dict[str, Any],
+        state: StateView,
+        states: Dict[str, StateView],
         session: Dict[str, Any]
-    ) -> Tuple[str, str, Optional[Dict[str, str]], bool]:
-        """Follow a transition to a target state or flow"""
-        if target.startswith("flow:"):
-            # Transition to another flow
-            return (target, "", {}, False)
-        elif target in states:
-            next_state_data = states[target]
-            return (
-                target,
-                next_state_data.get("message", ""),
-                next_state_data.get("options", {}),
-                next_state_data.get("is_end", False)
-            )
+    ) -> Tuple[str, str, Optional[Mapping[str, str]], bool]:
+        """Follow a transition from state to a target state or flow"""
+        reply = self._resolve(target, state, states)
+        if reply is not None:
+            return reply
+        elif target.startswith("flow:"):
+            # NLP intent targets aren't declared on the state itself
+            return (target, "", _EMPTY, False)
         else:
             # Invalid target
-            return ("main_menu", "Invalid navigation. Returning to main menu.", {}, False)
+            return ("main_menu", "Invalid navigation. Returning to main menu.", _EMPTY, False)
     
     def _generate_dynamic_response(
         self,
@@ -331,105 +558,168 @@ class FlowManager:
         user_input: str
     ) -> str:
         """Generate dynamic responses based on function name"""
-        
         data = session.get("data", {})
-        
-        if function_name == "train_status":
-            import random
-            train_number = data.get("train_number", user_input[-5:] if len(user_input) >= 5 else "12718")
-            # Simulate status with more realistic responses
-            statuses = [
-                ("On Time", "Great news! Train {} is running exactly on schedule."),
-                ("Running 10 minutes late", "I've checked, and Train {} is running approximately 10 minutes behind schedule. Not to worry, this is a minor delay."),
-                ("Running 30 minutes late", "I'm sorry to inform you that Train {} is currently running about 30 minutes late. We apologize for any inconvenience."),
-                ("Delayed by 1 hour", "Unfortunately, Train {} is experiencing a delay of approximately 1 hour. We understand this is frustrating and apologize for the inconvenience.")
-            ]
-            status, message = random.choice(statuses)
-            return message.format(train_number)
-        
-        elif function_name == "train_schedule":
-            train_number = data.get("train_number", user_input[-5:] if len(user_input) >= 5 else "17018")
-            # Simulate schedule with more details
-            schedules = {
-                "12718": ("8:45 AM", "5:30 PM", "8 hours 45 minutes"),
-                "17018": ("6:00 AM", "2:15 PM", "8 hours 15 minutes"),
-                "12009": ("7:30 AM", "1:45 PM", "6 hours 15 minutes")
-            }
-            times = schedules.get(train_number, ("8:00 AM", "6:00 PM", "10 hours"))
-            return f"Perfect! Train {train_number} departs at {times[0]} and arrives at {times[1]}. The total journey time is {times[2]}. Is there anything else you'd like to know about this train?"
-        
-        elif function_name == "booking_confirmation":
-            import random
-            train_class = data.get("train_class", "Sleeper")
-            train_number = data.get("train_number", "12718")
-            pnr = random.randint(1000000000, 9999999999)
-            return f"Excellent! Your booking has been confirmed successfully. You have booked a {train_class} class ticket on Train {train_number}. Your PNR number is {pnr}. Please save this PNR for future reference. Your ticket details will be sent to your registered mobile number. Is there anything else I can help you with?"
-        
-        elif function_name == "cancellation_confirmation":
-            import random
-            pnr = data.get("pnr", user_input)
-            refund_amt = random.randint(500, 2000)
-            return f"I've successfully cancelled your ticket with PNR {pnr}. Your refund of ₹{refund_amt} will be processed and credited back to your original payment method within 5 to 7 business days. A cancellation confirmation SMS will be sent to your registered mobile number. Thank you for using our service, and I'm sorry we couldn't accommodate your travel plans this time."
-        
-        elif function_name == "connect_agent":
-            return "I'm connecting you to one of our customer support agents. Please hold for just a moment, and someone will be with you shortly."
-        
-        elif function_name == "pnr_status_response":
-            import random
-            pnr = data.get("pnr", user_input)
-            statuses = [
-                "Confirmed",
-                "Waiting List (WL)",
-                "Reservation Against Cancellation (RAC)",
-                "Cancelled"
-            ]
-            status = random.choice(statuses)
-            berth_info = random.choice(["Lower Berth", "Middle Berth", "Upper Berth", "Side Lower", "Side Upper"])
-            coach = f"S{random.randint(1,15)}" if "Sleeper" in str(data.get("class", "")) else f"A{random.randint(1,10)}"
-            return f"Thank you for your PNR {pnr}. I've checked your booking status. Your ticket is {status}. You have been assigned {berth_info} in Coach {coach}. Is there anything else I can help you with?"
-        
-        elif function_name == "seat_availability_response":
-            import random
-            train_number = data.get("train_number", "12718")
-            train_class = data.get("class", "Sleeper")
-            travel_date = data.get("travel_date", "Tomorrow")
-            available = random.randint(5, 50)
-            waiting = random.randint(0, 20)
-            return f"Great! I've checked seat availability for Train {train_number} on {travel_date} in {train_class} class. There are {available} seats currently available, and {waiting} on the waiting list. Would you like to proceed with booking, or check another date?"
-        
-        elif function_name == "fare_response":
-            import random
-            train_number = data.get("train_number", "12718")
-            train_class = data.get("class", "Sleeper")
-            base_fares = {
-                "Sleeper": random.randint(300, 800),
-                "AC 3 Tier": random.randint(800, 1500),
-                "AC 2 Tier": random.randint(1500, 2500),
-                "First AC": random.randint(3000, 5000)
-            }
-            fare = base_fares.get(train_class, 500)
-            return f"Thank you! The fare for Train {train_number} in {train_class} class between your selected stations is ₹{fare}. This includes base fare and reservation charges. Would you like to proceed with booking, or check another class?"
-        
-        elif function_name == "trains_between_stations_response":
-            import random
-            source = data.get("source_station", "Source")
-            destination = data.get("destination_station", "Destination")
-            trains = [
-                ("12718", "Express", "8:45 AM", "5:30 PM", "8h 45m"),
-                ("17018", "Superfast", "6:00 AM", "2:15 PM", "8h 15m"),
-                ("12009", "Shatabdi", "7:30 AM", "1:45 PM", "6h 15m"),
-                ("12345", "Rajdhani", "10:00 AM", "6:30 PM", "8h 30m")
-            ]
-            selected_trains = random.sample(trains, min(3, len(trains)))
-            response = f"I found {len(selected_trains)} trains running between {source} and {destination}. "
-            for i, (num, name, dep, arr, dur) in enumerate(selected_trains, 1):
-                response += f"Train {num} {name} departs at {dep} and arrives at {arr}, journey time {dur}. "
-            response += "Would you like more details about any specific train?"
-            return response
-        
-        return "I'm processing your request. Please give me a moment..."
+        handler = _RESPONSE_HANDLERS.get(function_name, _default_response)
+        return handler(data, user_input)
     
     def reload_flows(self):
         """Reload all flows from disk (useful for hot-reloading)"""
         self._load_all_flows()
 
+
+# Private generator for the simulated responses; methods are bound once
+# so each draw skips the module attribute lookups
+_rng = random.Random()
+_choice = _rng.choice
+_randint = _rng.randint
+
+# Simulated data for dynamic responses
+_STATUSES = (
+    ("On Time", "Great news! Train {} is running exactly on schedule."),
+    ("Running 10 minutes late", "I've checked, and Train {} is running approximately 10 minutes behind schedule. Not to worry, this is a minor delay."),
+    ("Running 30 minutes late", "I'm sorry to inform you that Train {} is currently running about 30 minutes late. We apologize for any inconvenience."),
+    ("Delayed by 1 hour", "Unfortunately, Train {} is experiencing a delay of approximately 1 hour. We understand this is frustrating and apologize for the inconvenience.")
+)
+
+_SCHEDULES = {
+    "12718": ("8:45 AM", "5:30 PM", "8 hours 45 minutes"),
+    "17018": ("6:00 AM", "2:15 PM", "8 hours 15 minutes"),
+    "12009": ("7:30 AM", "1:45 PM", "6 hours 15 minutes")
+}
+
+_PNR_STATUSES = (
+    "Confirmed",
+    "Waiting List (WL)",
+    "Reservation Against Cancellation (RAC)",
+    "Cancelled"
+)
+
+_BERTHS = ("Lower Berth", "Middle Berth", "Upper Berth", "Side Lower", "Side Upper")
+
+# Fare range per class; other classes get a flat fare
+_BASE_FARES = {
+    "Sleeper": (300, 800),
+    "AC 3 Tier": (800, 1500),
+    "AC 2 Tier": (1500, 2500),
+    "First AC": (3000, 5000)
+}
+
+_TRAIN_LIST = (
+    ("12718", "Express", "8:45 AM", "5:30 PM", "8h 45m"),
+    ("17018", "Superfast", "6:00 AM", "2:15 PM", "8h 15m"),
+    ("12009", "Shatabdi", "7:30 AM", "1:45 PM", "6h 15m"),
+    ("12345", "Rajdhani", "10:00 AM", "6:30 PM", "8h 30m")
+)
+
+# Every ordered pick of three trains, so a response draws one tuple instead
+# of sampling; same distribution as random.sample(_TRAIN_LIST, 3)
+_TRAIN_PICKS = tuple(itertools.permutations(_TRAIN_LIST, min(3, len(_TRAIN_LIST))))
+
+
+def _train_status(data: Dict[str, Any], user_input: str) -> str:
+    train_number = data.get("train_number", user_input[-5:] if len(user_input) >= 5 else "12718")
+    # Simulate status with more realistic responses
+    status, message = _choice(_STATUSES)
+    return message.format(train_number)
+
+
+def _train_schedule(data: Dict[str, Any], user_input: str) -> str:
+    train_number = data.get("train_number", user_input[-5:] if len(user_input) >= 5 else "17018")
+    # Simulate schedule with more details
+    times = _SCHEDULES.get(train_number, ("8:00 AM", "6:00 PM", "10 hours"))
+    return f"Perfect! Train {train_number} departs at {times[0]} and arrives at {times[1]}. The total journey time is {times[2]}. Is there anything else you'd like to know about this train?"
+
+
+def _booking_confirmation(data: Dict[str, Any], user_input: str) -> str:
+    train_class = data.get("train_class", "Sleeper")
+    train_number = data.get("train_number", "12718")
+    pnr = _randint(1000000000, 9999999999)
+    return f"Excellent! Your booking has been confirmed successfully. You have booked a {train_class} class ticket on Train {train_number}. Your PNR number is {pnr}. Please save this PNR for future reference. Your ticket details will be sent to your registered mobile number. Is there anything else I can help you with?"
+
+
+def _cancellation_confirmation(data: Dict[str, Any], user_input: str) -> str:
+    pnr = data.get("pnr", user_input)
+    refund_amt = _randint(500, 2000)
+    return f"I've successfully cancelled your ticket with PNR {pnr}. Your refund of ₹{refund_amt} will be processed and credited back to your original payment method within 5 to 7 business days. A cancellation confirmation SMS will be sent to your registered mobile number. Thank you for using our service, and I'm sorry we couldn't accommodate your travel plans this time."
+
+
+def _connect_agent(data: Dict[str, Any], user_input: str) -> str:
+    return "I'm connecting you to one of our customer support agents. Please hold for just a moment, and someone will be with you shortly."
+
+
+def _pnr_status_response(data: Dict[str, Any], user_input: str) -> str:
+    pnr = data.get("pnr", user_input)
+    status = _choice(_PNR_STATUSES)
+    berth_info = _choice(_BERTHS)
+    coach = f"S{_randint(1,15)}" if "Sleeper" in str(data.get("class", "")) else f"A{_randint(1,10)}"
+    return f"Thank you for your PNR {pnr}. I've checked your booking status. Your ticket is {status}. You have been assigned {berth_info} in Coach {coach}. Is there anything else I can help you with?"
+
+
+def _seat_availability_response(data: Dict[str, Any], user_input: str) -> str:
+    train_number = data.get("train_number", "12718")
+    train_class = data.get("class", "Sleeper")
+    travel_date = data.get("travel_date", "Tomorrow")
+    available = _randint(5, 50)
+    waiting = _randint(0, 20)
+    return f"Great! I've checked seat availability for Train {train_number} on {travel_date} in {train_class} class. There are {available} seats currently available, and {waiting} on the waiting list. Would you like to proceed with booking, or check another date?"
+
+
+def _fare_response(data: Dict[str, Any], user_input: str) -> str:
+    train_number = data.get("train_number", "12718")
+    train_class = data.get("class", "Sleeper")
+    fare_range = _BASE_FARES.get(train_class)
+    fare = _randint(*fare_range) if fare_range else 500
+    return f"Thank you! The fare for Train {train_number} in {train_class} class between your selected stations is ₹{fare}. This includes base fare and reservation charges. Would you like to proceed with booking, or check another class?"
+
+
+def _trains_between_stations_response(data: Dict[str, Any], user_input: str) -> str:
+    source = data.get("source_station", "Source")
+    destination = data.get("destination_station", "Destination")
+    selected_trains = _choice(_TRAIN_PICKS)
+    parts = [f"I found {len(selected_trains)} trains running between {source} and {destination}. "]
+    append = parts.append
+    for num, name, dep, arr, dur in selected_trains:
+        append(f"Train {num} {name} departs at {dep} and arrives at {arr}, journey time {dur}. ")
+    append("Would you like more details about any specific train?")
+    return "".join(parts)
+
+
+def _default_response(data: Dict[str, Any], user_input: str) -> str:
+    return "I'm processing your request. Please give me a moment..."
+
+
+_RESPONSE_HANDLERS = {
+    "train_status": _train_status,
+    "train_schedule": _train_schedule,
+    "booking_confirmation": _booking_confirmation,
+    "cancellation_confirmation": _cancellation_confirmation,
+    "connect_agent": _connect_agent,
+    "pnr_status_response": _pnr_status_response,
+    "seat_availability_response": _seat_availability_response,
+    "fare_response": _fare_response,
+    "trains_between_stations_response": _trains_between_stations_response,
+}
+
+
+def _owned_privately(st: os.stat_result) -> bool:
+    """Whether a file is ours and writable by no one else (always true where
+    the platform has no uids)"""
+    getuid = getattr(os, "getuid", None)
+    if getuid is None:
+        return True
+    return st.st_uid == getuid() and not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def get_flow_manager(flows_dir: str = None) -> FlowManager:
+    """Return the process-wide FlowManager for a flows directory (the bundled
+    flows by default), loading flows on first use"""
+    if flows_dir is None:
+        flows_dir = _DEFAULT_FLOWS_DIR
+    # Normalize first, so every spelling of a directory shares one manager
+    return _flow_manager_for(os.path.realpath(flows_dir))
+
+
+@lru_cache(maxsize=None)
+def _flow_manager_for(flows_dir: str) -> FlowManager:
+    """Build the single FlowManager for a normalized flows directory"""
+    return FlowManager(flows_dir)
@@ -1,5 +1,6 @@
 import os
 import sys
+import tempfile
 from pathlib import Path
 
 import pytest
@@ -10,22 +11,22 @@ ROOT_DIR = Path(__file__).resolve().parents[2]
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
+# Keep the pickled flow cache out of the source tree; removed at exit
+_FLOW_CACHE_DIR = tempfile.TemporaryDirectory(prefix="ivr-flow-cache-")
+os.environ["IVR_FLOW_CACHE_DIR"] = _FLOW_CACHE_DIR.name
+
 from backend.main import app  # noqa: E402
 
 
 @pytest.fixture(scope="session")
-def event_loop():
-    """Pytest-asyncio hook to use the global event loop for httpx."""
-    import asyncio
-
-    loop = asyncio.get_event_loop_policy().new_event_loop()
-    yield loop
-    loop.close()
+def anyio_backend():
+    """Run every async test on a single asyncio backend."""
+    return "asyncio"
 
 
-@pytest.fixture
+@pytest.fixture(scope="session")
 async def async_client():
-    """Return an HTTPX AsyncClient wired to the FastAPI app."""
+    """Return an HTTPX AsyncClient wired to the FastAPI app, shared by the session."""
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as client:
         yield client
@@ -0,0 +1,38 @@
+import pytest
+
+
+@pytest.fixture(scope="module")
+def nlp():
+    from backend.utils.advanced_nlp import advanced_nlp
+
+    return advanced_nlp
+
+
+@pytest.mark.parametrize(
+    "utterance, expected",
+    [
+        ("ac 3", "AC 3 Tier"),
+        ("i want ac 3 tier", "AC 3 Tier"),
+        ("ac 2", "AC 2 Tier"),
+        ("first ac", "First AC"),
+        ("ac", "AC"),
+        ("sleeper please", "Sleeper"),
+    ],
+)
+def test_longest_class_name_wins(nlp, utterance, expected):
+    assert nlp.extract_class_from_speech(utterance) == expected
+
+
+@pytest.mark.parametrize("utterance", ["hi", "hello there", "good morning"])
+def test_greetings_are_recognised(nlp, utterance):
+    assert nlp.is_greeting(utterance)["type"] == "greeting"
+
+
+@pytest.mark.parametrize("utterance", ["thanks", "thank you"])
+def test_thanks_get_the_thanks_reply(nlp, utterance):
+    assert nlp.is_greeting(utterance)["response"].startswith("You're very welcome")
+
+
+@pytest.mark.parametrize("utterance", ["this train", "which train is this", "thanksgiving"])
+def test_greeting_words_inside_other_words_are_ignored(nlp, utterance):
+    assert nlp.is_greeting(utterance) is None
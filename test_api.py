@@ -3,14 +3,19 @@ Milestone 4 unit tests covering FastAPI IVR endpoints.
 Run with: pytest milestone4/unit_tests
 """
 
+import pytest
 from fastapi.testclient import TestClient
 
 from backend.main import app
 
-client = TestClient(app)
 
+@pytest.fixture(scope="session")
+def client():
+    with TestClient(app) as test_client:
+        yield test_client
 
-def start_session():
+
+def start_session(client):
     response = client.post("/api/ivr/start")
     assert response.status_code == 200
     payload = response.json()
@@ -19,7 +24,7 @@ def start_session():
     return payload
 
 
-def test_healthcheck_endpoint():
+def test_healthcheck_endpoint(client):
     response = client.get("/health")
     assert response.status_code == 200
     data = response.json()
@@ -27,8 +32,8 @@ def test_healthcheck_endpoint():
     assert data["uptime_seconds"] >= 0
 
 
-def test_session_lifecycle():
-    start_payload = start_session()
+def test_session_lifecycle(client):
+    start_payload = start_session(client)
     session_id = start_payload["session_id"]
 
     input_payload = {
@@ -49,13 +54,13 @@ def test_session_lifecycle():
     assert summary["total_exchanges"] >= 1
 
 
-def test_invalid_session_rejected():
+def test_invalid_session_rejected(client):
     payload = {"session_id": "invalid", "input": "1"}
     response = client.post("/api/ivr/input", json=payload)
     assert response.status_code == 404
 
 
-def test_flows_listing():
+def test_flows_listing(client):
     response = client.get("/api/flows")
     assert response.status_code == 200
     body = response.json()
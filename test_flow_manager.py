@@ -1,3 +1,6 @@
+import json
+import os
+import shutil
 from pathlib import Path
 
 import pytest
@@ -7,9 +10,9 @@ ROOT_DIR = Path(__file__).resolve().parents[2]
 
 @pytest.fixture(scope="module")
 def flow_manager():
-    from backend.utils.flow_manager import FlowManager
+    from backend.utils.flow_manager import get_flow_manager
 
-    return FlowManager()
+    return get_flow_manager()
 
 
 def test_flows_are_loaded(flow_manager):
@@ -47,3 +50,174 @@ def test_invalid_input_recovers(flow_manager):
     assert "didn't quite catch" in message.lower()
     assert not is_end
 
+
+def test_one_utterance_fills_chained_fields(flow_manager):
+    session = {"data": {}}
+    flow = flow_manager.get_flow("booking")
+    next_state, message, options, is_end = flow_manager.process_input(
+        flow,
+        current_state="select_class",
+        user_input="ac 3 tier on train 12718",
+        is_keypad=False,
+        session=session,
+    )
+    assert next_state == "confirm_booking"
+    assert session["data"] == {"train_class": "AC 3 Tier", "train_number": "12718"}
+
+
+@pytest.mark.parametrize(
+    "utterance, expected",
+    [
+        ("book my ticket", "flow:booking"),
+        ("i want to book my ticket", "flow:booking"),
+        ("check pnr", "flow:pnr_status"),
+        ("how many seats are booked", "flow:seat_availability"),
+        ("is the train fully booked", "flow:seat_availability"),
+        ("seats booked", "flow:seat_availability"),
+        ("booking status", "flow:pnr_status"),
+        ("my booking", "flow:pnr_status"),
+        ("delete booking", "flow:cancellation"),
+    ],
+)
+def test_speech_routes_from_main_menu(flow_manager, utterance, expected):
+    session = {"data": {}}
+    flow = flow_manager.get_flow("train_main")
+    next_state, message, options, is_end = flow_manager.process_input(
+        flow,
+        current_state="main_menu",
+        user_input=utterance,
+        is_keypad=False,
+        session=session,
+    )
+    assert next_state == expected
+
+
+def test_possessive_phrase_does_not_override_verb(flow_manager):
+    session = {"data": {}}
+    flow = flow_manager.get_flow("train_main")
+    next_state, message, options, is_end = flow_manager.process_input(
+        flow,
+        current_state="main_menu",
+        user_input="cancel my ticket",
+        is_keypad=False,
+        session=session,
+    )
+    assert next_state == "flow:cancellation"
+
+
+def test_chain_ending_in_flow_jump_keeps_extracted_fields(flow_manager):
+    flow = {
+        "states": {
+            "pick_class": {
+                "message": "class?",
+                "actions": {"collect_data": {"field": "train_class", "next_state": "pick_number"}},
+            },
+            "pick_number": {
+                "message": "num?",
+                "actions": {"collect_data": {"field": "train_number", "next_state": "flow:booking"}},
+            },
+        }
+    }
+    session = {"data": {}}
+    next_state, message, options, is_end = flow_manager.process_input(
+        flow,
+        current_state="pick_class",
+        user_input="sleeper on 12718",
+        is_keypad=False,
+        session=session,
+    )
+    assert next_state == "flow:booking"
+    assert session["data"] == {"train_class": "Sleeper", "train_number": "12718"}
+
+
+@pytest.mark.parametrize("utterance", ["12718", "schedule of 12718"])
+def test_train_number_does_not_answer_class_question(flow_manager, utterance):
+    session = {"data": {}}
+    flow = flow_manager.get_flow("booking")
+    next_state, message, options, is_end = flow_manager.process_input(
+        flow,
+        current_state="select_class",
+        user_input=utterance,
+        is_keypad=False,
+        session=session,
+    )
+    assert session["data"].get("train_class") != "Sleeper"
+
+
+def _copy_flows(flow_manager, target_dir):
+    for flow_file in flow_manager.FLOW_FILES:
+        shutil.copy2(Path(flow_manager.flows_dir) / flow_file, target_dir / flow_file)
+
+
+def test_sidecar_invalidated_by_mtime_change(flow_manager, tmp_path):
+    from backend.utils.flow_manager import FlowManager
+
+    _copy_flows(flow_manager, tmp_path)
+    FlowManager(flows_dir=str(tmp_path))  # writes the sidecar
+
+    # Same size, newer mtime
+    path = tmp_path / "agent.json"
+    name = json.loads(path.read_bytes())["name"]
+    edited = name[:-1] + ("X" if name[-1] != "X" else "Y")
+    stat = path.stat()
+    path.write_bytes(path.read_bytes().replace(json.dumps(name).encode(), json.dumps(edited).encode(), 1))
+    assert path.stat().st_size == stat.st_size
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    assert FlowManager(flows_dir=str(tmp_path)).get_flow("agent")["name"] == edited
+
+
+def test_sidecar_invalidated_by_size_change(flow_manager, tmp_path):
+    from backend.utils.flow_manager import FlowManager
+
+    _copy_flows(flow_manager, tmp_path)
+    FlowManager(flows_dir=str(tmp_path))  # writes the sidecar
+
+    # Different size, same mtime
+    path = tmp_path / "agent.json"
+    flow = json.loads(path.read_text(encoding="utf-8"))
+    flow["name"] += " (edited)"
+    stat = path.stat()
+    path.write_text(json.dumps(flow), encoding="utf-8")
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert FlowManager(flows_dir=str(tmp_path)).get_flow("agent")["name"] == flow["name"]
+
+
+@pytest.mark.skipif(not hasattr(os, "getuid"), reason="no file ownership")
+def test_sidecar_ignored_when_writable_by_others(flow_manager, tmp_path):
+    import pickle
+
+    from backend.utils.flow_manager import FlowManager
+
+    _copy_flows(flow_manager, tmp_path)
+    sidecar = Path(FlowManager(flows_dir=str(tmp_path))._sidecar_path)
+    assert sidecar.stat().st_mode & 0o777 == 0o644
+
+    # Same fingerprint, different flows: only trusted files may be loaded
+    cached = pickle.loads(sidecar.read_bytes())
+    cached["flows"]["agent"]["name"] = "planted"
+    sidecar.write_bytes(pickle.dumps(cached))
+    assert FlowManager(flows_dir=str(tmp_path)).get_flow("agent")["name"] == "planted"
+
+    sidecar.chmod(0o666)
+    assert FlowManager(flows_dir=str(tmp_path)).get_flow("agent")["name"] != "planted"
+
+
+def test_one_shared_manager_per_flows_dir(flow_manager, tmp_path):
+    from backend.utils.flow_manager import get_flow_manager
+
+    assert get_flow_manager() is flow_manager
+    assert get_flow_manager(None) is flow_manager
+    assert get_flow_manager(flow_manager.flows_dir + os.sep) is flow_manager
+
+    _copy_flows(flow_manager, tmp_path)
+    other = get_flow_manager(str(tmp_path))
+    assert other is not flow_manager
+    assert get_flow_manager() is flow_manager
+
+
+def test_app_shares_the_package_flow_manager(flow_manager):
+    import backend.main
+
+    assert backend.main.flow_manager is flow_manager